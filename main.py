@@ -6,6 +6,7 @@ import signal
 import schedule
 import argparse
 import json
+from collections import deque
 from datetime import datetime, timedelta
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -20,7 +21,7 @@ from modules.websocket_handler import BinanceWebSocketManager
 from modules.config import (
     TRADING_SYMBOL, TIMEFRAME, STRATEGY, LOG_LEVEL,
     USE_TELEGRAM, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID,
-    SEND_DAILY_REPORT, DAILY_REPORT_TIME, AUTO_COMPOUND,
+    SEND_DAILY_REPORT, DAILY_REPORT_TIME, AUTO_COMPOUND, USE_ATR_STOP,
     # Add these to your config.py:
     # BACKTEST_BEFORE_LIVE = True
     # BACKTEST_MIN_PROFIT_PCT = 5.0
@@ -58,13 +59,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of candles kept per symbol for signal generation
+KLINES_BUFFER_SIZE = 200
+
 # Global variables
 running = True
 binance_client = None
 risk_manager = None
 strategy = None
 websocket_manager = None
-klines_data = {}
+klines_data = {}  # Rolling buffer of the latest candles per symbol
 new_candle_received = {}
 stats = {
     'total_trades': 0,
@@ -175,13 +179,15 @@ def setup():
         logger.error(f"Failed to initialize Binance client: {e}")
         exit(1)
     
-    # Initialize risk manager
-    risk_manager = RiskManager(binance_client)
-    
     # Get the selected trading strategy
     strategy = get_strategy(STRATEGY)
     logger.info(f"Using trading strategy: {strategy.strategy_name}")
     
+    # Initialize risk manager
+    risk_manager = RiskManager(binance_client, strategy)
+    # Fetch symbol info for every symbol up front with a single request
+    risk_manager.load_all_symbol_info()
+    
     # Initialize futures settings for the trading symbol
     try:
         binance_client.initialize_futures(TRADING_SYMBOL)
@@ -313,12 +319,41 @@ def initialize_klines_data():
             logger.warning(f"Not enough historical data to initialize (got {len(klines) if klines else 0} candles)")
             return
             
-        klines_data[TRADING_SYMBOL] = klines
+        klines_data[TRADING_SYMBOL] = deque(klines, maxlen=KLINES_BUFFER_SIZE)
         logger.info(f"Initialized historical data with {len(klines)} candles")
     except Exception as e:
         logger.error(f"Error initializing klines data: {e}")
 
 
+def store_candle(klines, kline_data):
+    """
+    Put a websocket kline into the candle buffer: it replaces the newest candle
+    if that is the same (still forming) candle, otherwise it is appended. This
+    keeps one entry per candle, so strategies can update their indicators
+    incrementally when a candle closes.
+    """
+    candle = [
+        kline_data['open_time'],
+        str(kline_data['open']),
+        str(kline_data['high']),
+        str(kline_data['low']),
+        str(kline_data['close']),
+        str(kline_data['volume']),
+        kline_data['close_time'],
+        "0",
+        "0",
+        "0",
+        "0",
+        "0"
+    ]
+    
+    if klines and klines[-1][0] == candle[0]:
+        klines[-1] = candle
+    else:
+        # The deque drops the oldest candle itself once it is full
+        klines.append(candle)
+
+
 def on_kline_closed(symbol, kline_data):
     """Callback for when a kline (candlestick) closes"""
     global klines_data, new_candle_received
@@ -326,28 +361,10 @@ def on_kline_closed(symbol, kline_data):
     logger.info(f"Kline closed for {symbol}: {kline_data['close_time']}")
     
     try:
-        candle = [
-            kline_data['open_time'],
-            str(kline_data['open']),
-            str(kline_data['high']),
-            str(kline_data['low']),
-            str(kline_data['close']),
-            str(kline_data['volume']),
-            kline_data['close_time'],
-            "0",
-            "0",
-            "0",
-            "0",
-            "0"
-        ]
-        
-        if symbol in klines_data:
-            klines_data[symbol].append(candle)
-            if len(klines_data[symbol]) > 200:
-                klines_data[symbol].pop(0)
-        else:
-            klines_data[symbol] = [candle]
-            
+        if symbol not in klines_data:
+            klines_data[symbol] = deque(maxlen=KLINES_BUFFER_SIZE)
+        store_candle(klines_data[symbol], kline_data)
+        
         new_candle_received[symbol] = True
         check_for_signals(symbol)
         
@@ -371,23 +388,9 @@ def on_kline_update(symbol, kline_data):
     # Store data for later use
     global klines_data
     if symbol in klines_data and klines_data[symbol]:
-        # Update the latest candle with real-time data until it's closed
+        # Update the forming candle with real-time data until it's closed
         if not kline_data['is_closed'] and len(klines_data[symbol]) > 0:
-            candle = [
-                kline_data['open_time'],
-                str(kline_data['open']),
-                str(kline_data['high']),
-                str(kline_data['low']),
-                str(kline_data['close']),
-                str(kline_data['volume']),
-                kline_data['close_time'],
-                "0",
-                "0",
-                "0",
-                "0",
-                "0"
-            ]
-            klines_data[symbol][-1] = candle
+            store_candle(klines_data[symbol], kline_data)
 
 
 def on_book_ticker(symbol, ticker_data):
@@ -457,8 +460,12 @@ def on_account_update(balance_updates, position_updates):
             stats['current_balance'] = new_balance
             logger.info(f"Balance updated: {new_balance} USDT")
             
+            risk_manager.invalidate_balance()
             risk_manager.update_balance_for_compounding()
             
+        if position_updates:
+            risk_manager.invalidate_positions()
+            
         for symbol, position in position_updates.items():
             logger.info(f"Position update for {symbol}: {position['position_amount']} @ {position['entry_price']}, PnL: {position['unrealized_pnl']}")
             
@@ -491,12 +498,22 @@ def on_order_update(order_data):
             else:
                 logger.info(f"✅✅✅ EXECUTED {order_type} {side} ORDER: {filled_qty} {symbol} @ {price} ✅✅✅")
                 
+            # Every closing fill (signal exits, stop loss and take profit) feeds the
+            # strategy's edge estimate for Kelly sizing
+            realized_profit = order_data['realized_profit']
+            if realized_profit != 0 and filled_qty > 0:
+                # Return per unit of entry notional, so it doesn't depend on the position size.
+                # Closing a long sells, so the entry notional is the exit notional minus the PnL
+                exit_notional = filled_qty * price
+                entry_notional = exit_notional - realized_profit if side == 'SELL' else exit_notional + realized_profit
+                if entry_notional > 0:
+                    strategy.record_trade_return(symbol, realized_profit / entry_notional)
+                    
             # For filled orders, update trade statistics
             if order_type == 'MARKET':
                 stats['total_trades'] += 1
                 stats['last_trade_time'] = datetime.now()
                 
-                realized_profit = order_data['realized_profit']
                 if realized_profit > 0:
                     stats['winning_trades'] += 1
                     logger.info(f"💲💲💲 PROFIT: +{realized_profit:.2f} USDT 💲💲💲")
@@ -581,15 +598,19 @@ def check_for_signals(symbol=None):
         position = binance_client.get_position_info(symbol)
         position_amount = position['position_amount'] if position else 0
         
-        signal = strategy.get_signal(klines)
+        signal = strategy.get_signal(klines, symbol)
+        # ATR maintained by the strategy's incremental update, for volatility-scaled stops
+        atr_value = strategy.get_atr(symbol) if USE_ATR_STOP else None
         
         if signal == "BUY" and position_amount <= 0:
             if position_amount < 0:
                 logger.info("Closing existing short position before going long")
                 binance_client.place_market_order(symbol, "BUY", abs(position_amount))
+                risk_manager.invalidate_positions()
+                risk_manager.invalidate_balance()
                 
             if risk_manager.should_open_position(symbol):
-                stop_loss_price = risk_manager.calculate_stop_loss(symbol, "BUY", current_price)
+                stop_loss_price = risk_manager.calculate_stop_loss(symbol, "BUY", current_price, atr_value)
                 
                 quantity = risk_manager.calculate_position_size(
                     symbol, "BUY", current_price, stop_loss_price
@@ -597,6 +618,8 @@ def check_for_signals(symbol=None):
                 
                 if quantity > 0:
                     order = binance_client.place_market_order(symbol, "BUY", quantity)
+                    risk_manager.invalidate_positions()
+                    risk_manager.invalidate_balance()
                     if order:
                         logger.info(f"Opened long position: {quantity} {symbol} at {current_price}")
                         
@@ -604,6 +627,7 @@ def check_for_signals(symbol=None):
                             binance_client.place_stop_loss_order(
                                 symbol, "SELL", quantity, stop_loss_price
                             )
+                        risk_manager.record_stop_loss(symbol, stop_loss_price)
                             
                         take_profit_price = risk_manager.calculate_take_profit(symbol, "BUY", current_price)
                         if take_profit_price:
@@ -615,9 +639,11 @@ def check_for_signals(symbol=None):
             if position_amount > 0:
                 logger.info("Closing existing long position before going short")
                 binance_client.place_market_order(symbol, "SELL", position_amount)
+                risk_manager.invalidate_positions()
+                risk_manager.invalidate_balance()
                 
             if risk_manager.should_open_position(symbol):
-                stop_loss_price = risk_manager.calculate_stop_loss(symbol, "SELL", current_price)
+                stop_loss_price = risk_manager.calculate_stop_loss(symbol, "SELL", current_price, atr_value)
                 
                 quantity = risk_manager.calculate_position_size(
                     symbol, "SELL", current_price, stop_loss_price
@@ -625,13 +651,16 @@ def check_for_signals(symbol=None):
                 
                 if quantity > 0:
                     order = binance_client.place_market_order(symbol, "SELL", quantity)
+                    risk_manager.invalidate_positions()
+                    risk_manager.invalidate_balance()
                     if order:
                         logger.info(f"Opened short position: {quantity} {symbol} at {current_price}")
                         
                         if stop_loss_price:
                             binance_client.place_stop_loss_order(
-                                symbol, "BUY", quantity, new_stop
+                                symbol, "BUY", quantity, stop_loss_price
                             )
+                        risk_manager.record_stop_loss(symbol, stop_loss_price)
                             
                         take_profit_price = risk_manager.calculate_take_profit(symbol, "SELL", current_price)
                         if take_profit_price:
@@ -653,6 +682,7 @@ def check_for_signals(symbol=None):
                 binance_client.place_stop_loss_order(
                     symbol, opposite_side, abs(position['position_amount']), new_stop
                 )
+                risk_manager.record_stop_loss(symbol, new_stop)
                 
                 logger.info(f"Updated trailing stop loss to {new_stop}")
     
@@ -261,6 +261,14 @@ class Backtester:
             logger.error("Not enough historical data for backtesting")
             return None
             
+        # Typed columns for the strategy, so each candle passes views instead of converted rows
+        candles = {
+            'close_time': df['close_time'].to_numpy(),
+            'high': df['high'].to_numpy(dtype=np.float64),
+            'low': df['low'].to_numpy(dtype=np.float64),
+            'close': df['close'].to_numpy(dtype=np.float64),
+        }
+        
         # Process each candle
         prev_idx = 30  # Start with enough data for indicators
         for i in tqdm(range(prev_idx, len(df))):
@@ -272,7 +280,7 @@ class Backtester:
             low = current['low']
             
             # Get historical data up to current candle for signal generation
-            hist_data = df.iloc[:i+1].values.tolist()
+            hist_data = {name: column[:i+1] for name, column in candles.items()}
             
             # First check if stop loss or take profit was hit
             if self.in_position:
@@ -282,7 +290,7 @@ class Backtester:
                     continue
             
             # Generate trading signal
-            signal = self.strategy.get_signal(hist_data)
+            signal = self.strategy.get_signal(hist_data, self.symbol)
             
             # Process trading signal
             if signal == "BUY" and (not self.in_position or self.position_side == "SELL"):
@@ -9,6 +9,19 @@ from modules.config import (
 
 logger = logging.getLogger(__name__)
 
+
+def parse_symbol_info(symbol_info):
+    """Pick the precisions and order size filters out of one exchangeInfo symbol entry"""
+    filters = {f['filterType']: f for f in symbol_info['filters']}
+    return {
+        'price_precision': symbol_info['pricePrecision'],
+        'quantity_precision': symbol_info['quantityPrecision'],
+        'min_qty': float(filters['LOT_SIZE']['minQty']),
+        'max_qty': float(filters['LOT_SIZE']['maxQty']),
+        'min_notional': float(filters['MIN_NOTIONAL']['notional'])
+    }
+
+
 class BinanceClient:
     def __init__(self):
         if not API_KEY or not API_SECRET:
@@ -197,6 +210,24 @@ class BinanceClient:
     
     def get_position_info(self, symbol):
         """Get current position information"""
+        positions = self.get_all_positions()
+        if positions is None:
+            return None
+            
+        for position in positions:
+            if position['symbol'] == symbol:
+                return {
+                    'symbol': position['symbol'],
+                    'position_amount': float(position['positionAmt']),
+                    'entry_price': float(position['entryPrice']),
+                    'unrealized_profit': float(position['unRealizedProfit']),
+                    'leverage': int(position['leverage']),
+                    'isolated': position['isolated'],
+                }
+        return None
+        
+    def get_all_positions(self):
+        """Get the raw futures position list of every symbol, None on failure"""
         max_retries = 5  # Increased from 3 to 5
         backoff_factor = 2
         
@@ -207,18 +238,7 @@ class BinanceClient:
                     initial_pause = 0.5 * retry
                     time.sleep(initial_pause)
                 
-                positions = self.client.futures_position_information()
-                for position in positions:
-                    if position['symbol'] == symbol:
-                        return {
-                            'symbol': position['symbol'],
-                            'position_amount': float(position['positionAmt']),
-                            'entry_price': float(position['entryPrice']),
-                            'unrealized_profit': float(position['unRealizedProfit']),
-                            'leverage': int(position['leverage']),
-                            'isolated': position['isolated'],
-                        }
-                return None
+                return self.client.futures_position_information()
             except Exception as e:
                 error_str = str(e)
                 # Check for common error types that should be retried
@@ -237,7 +257,7 @@ class BinanceClient:
                 
                 if should_retry and retry < max_retries - 1:
                     wait_time = backoff_factor * (2 ** retry)  # Exponential backoff
-                    logger.warning(f"Retrying get_position_info due to error: {e}")
+                    logger.warning(f"Retrying get_all_positions due to error: {e}")
                     
                     # For connection-specific errors, try to reset the client connection
                     if "Connection aborted" in error_str or "RemoteDisconnected" in error_str:
@@ -281,13 +301,7 @@ class BinanceClient:
                 exchange_info = self.client.futures_exchange_info()
                 for symbol_info in exchange_info['symbols']:
                     if symbol_info['symbol'] == symbol:
-                        return {
-                            'price_precision': symbol_info['pricePrecision'],
-                            'quantity_precision': symbol_info['quantityPrecision'],
-                            'min_qty': float([f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'][0]['minQty']),
-                            'max_qty': float([f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'][0]['maxQty']),
-                            'min_notional': float([f for f in symbol_info['filters'] if f['filterType'] == 'MIN_NOTIONAL'][0]['notional'])
-                        }
+                        return parse_symbol_info(symbol_info)
                 return None
             except Exception as e:
                 error_str = str(e)
@@ -318,6 +332,51 @@ class BinanceClient:
         
         logger.error("Maximum retries reached when getting symbol info")
         return None
+        
+    def load_all_symbol_info(self):
+        """
+        Get the symbol information of every futures symbol from a single
+        exchangeInfo request, as {symbol: info} in the format of get_symbol_info
+        """
+        max_retries = 3
+        backoff_factor = 2
+        
+        for retry in range(max_retries):
+            try:
+                exchange_info = self.client.futures_exchange_info()
+                all_symbol_info = {}
+                for symbol_info in exchange_info['symbols']:
+                    try:
+                        all_symbol_info[symbol_info['symbol']] = parse_symbol_info(symbol_info)
+                    except (KeyError, ValueError):
+                        # Symbols without the usual filters can't be traded by the bot
+                        continue
+                return all_symbol_info
+            except Exception as e:
+                error_str = str(e)
+                # Check for common error types that should be retried
+                retry_errors = [
+                    "Invalid JSON",
+                    "Connection reset",
+                    "Read timed out",
+                    "Connection aborted",
+                    "Connection refused",
+                    "code=0",
+                    "<!DOCTYPE html>"
+                ]
+                
+                should_retry = any(err in error_str for err in retry_errors)
+                
+                if should_retry and retry < max_retries - 1:
+                    wait_time = backoff_factor * (2 ** retry)
+                    logger.warning(f"Retrying load_all_symbol_info due to error: {e}")
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"Failed to load symbol info: {e}")
+                    return None
+                    
+        logger.error("Maximum retries reached when loading symbol info")
+        return None
     
     def get_historical_klines(self, symbol, interval, start_str, end_str=None, limit=1000):
         """Get historical candlestick data"""
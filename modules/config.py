@@ -35,6 +35,13 @@ INITIAL_BALANCE = float(os.getenv('INITIAL_BALANCE', '50.0'))  # Starting with $
 RISK_PER_TRADE = float(os.getenv('RISK_PER_TRADE', '0.02'))  # 2% risk per trade
 MAX_OPEN_POSITIONS = int(os.getenv('MAX_OPEN_POSITIONS', '1'))
 
+# Fractional Kelly sizing from the strategy's recent trade returns
+KELLY_FRACTION = float(os.getenv('KELLY_FRACTION', '0.25'))  # Use 25% of the full Kelly fraction
+KELLY_CAP = float(os.getenv('KELLY_CAP', str(RISK_PER_TRADE * 4)))  # Never risk more than this fraction
+KELLY_MIN_TRADES = int(os.getenv('KELLY_MIN_TRADES', '10'))  # Fall back to RISK_PER_TRADE until then
+KELLY_MIN_RISK = float(os.getenv('KELLY_MIN_RISK', str(RISK_PER_TRADE * 0.25)))  # Risk floor while there is no positive edge
+KELLY_EWMA_ALPHA = float(os.getenv('KELLY_EWMA_ALPHA', '0.1'))  # Weight of the newest trade return
+
 # Auto-compounding settings
 AUTO_COMPOUND = os.getenv('AUTO_COMPOUND', 'True').lower() == 'true'
 COMPOUND_REINVEST_PERCENT = float(os.getenv('COMPOUND_REINVEST_PERCENT', '0.75'))  # Reinvest 75% of profits
@@ -52,11 +59,18 @@ TIMEFRAME = os.getenv('TIMEFRAME', '15m')  # Default timeframe
 # Risk management
 USE_STOP_LOSS = os.getenv('USE_STOP_LOSS', 'True').lower() == 'true'
 STOP_LOSS_PCT = float(os.getenv('STOP_LOSS_PCT', '0.03'))  # 3% stop loss
+USE_ATR_STOP = os.getenv('USE_ATR_STOP', 'False').lower() == 'true'  # Volatility-scaled stop instead of STOP_LOSS_PCT
+ATR_PERIOD = int(os.getenv('ATR_PERIOD', '14'))
+ATR_STOP_MULT = float(os.getenv('ATR_STOP_MULT', '2.0'))  # Stop distance in ATRs
 USE_TAKE_PROFIT = os.getenv('USE_TAKE_PROFIT', 'True').lower() == 'true'
 TAKE_PROFIT_PCT = float(os.getenv('TAKE_PROFIT_PCT', '0.06'))  # 6% take profit
 TRAILING_STOP = os.getenv('TRAILING_STOP', 'False').lower() == 'true'
 TRAILING_STOP_PCT = float(os.getenv('TRAILING_STOP_PCT', '0.015'))  # 1.5% trailing stop
 
+# Cache settings for exchange lookups
+SYMBOL_INFO_CACHE_TTL = float(os.getenv('SYMBOL_INFO_CACHE_TTL', '3600'))  # seconds
+POSITION_INFO_CACHE_TTL = float(os.getenv('POSITION_INFO_CACHE_TTL', '1.0'))  # seconds
+
 # Backtesting parameters
 BACKTEST_START_DATE = os.getenv('BACKTEST_START_DATE', '2023-01-01')
 BACKTEST_END_DATE = os.getenv('BACKTEST_END_DATE', '')  # Empty means use current date
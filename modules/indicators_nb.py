@@ -0,0 +1,87 @@
+import numpy as np
+from numba import njit
+
+# fastmath without the no-NaN/no-Inf assumptions, since the leading values of
+# every indicator are NaN until the window is filled (same as the ta library)
+_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    """RSI from smoothed averages, 100 when there were no losses (as in ta)"""
+    if avg_loss == 0.0:
+        return 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+def true_range(high, low, prev_close):
+    """Largest of the candle range and the gaps from the previous close"""
+    return max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+
+# Jitted copies of the scalar helpers for the kernels, while the per-candle
+# updates in strategies.py call the plain Python versions above
+_rsi_from_averages_nb = njit(cache=True, fastmath=_FASTMATH)(rsi_from_averages)
+_true_range_nb = njit(cache=True, fastmath=_FASTMATH)(true_range)
+
+
+@njit(cache=True, fastmath=_FASTMATH)
+def combined(close, high, low, fast_n, slow_n, rsi_n, atr_n):
+    """
+    Fused single pass over the candles for both EMAs, the RSI and the ATR.
+    Returns (prev_fast, prev_slow, fast, slow, prev_rsi, rsi, avg_gain, avg_loss, atr),
+    i.e. the last two values of the EMAs and the RSI, the final Wilder averages
+    and the last ATR value.
+    """
+    fast_alpha = 2.0 / (fast_n + 1)
+    slow_alpha = 2.0 / (slow_n + 1)
+    rsi_alpha = 1.0 / rsi_n
+    
+    fast = close[0]
+    slow = close[0]
+    gain = 0.0
+    loss = 0.0
+    # Sum of the true ranges until there are atr_n of them, then the Wilder ATR
+    atr_value = high[0] - low[0]
+    prev_fast = np.nan
+    prev_slow = np.nan
+    prev_gain = np.nan
+    prev_loss = np.nan
+    for i in range(1, close.size):
+        prev_fast = fast
+        prev_slow = slow
+        prev_gain = gain
+        prev_loss = loss
+        change = close[i] - close[i - 1]
+        fast = fast_alpha * close[i] + (1.0 - fast_alpha) * fast
+        slow = slow_alpha * close[i] + (1.0 - slow_alpha) * slow
+        gain = (1.0 - rsi_alpha) * gain + rsi_alpha * max(change, 0.0)
+        loss = (1.0 - rsi_alpha) * loss + rsi_alpha * max(-change, 0.0)
+        tr = _true_range_nb(high[i], low[i], close[i - 1])
+        if i < atr_n:
+            atr_value += tr
+            if i == atr_n - 1:
+                atr_value /= atr_n
+        else:
+            atr_value = (atr_value * (atr_n - 1) + tr) / atr_n
+            
+    # NaN until each window is filled, same as the ta library
+    size = close.size
+    rsi = _rsi_from_averages_nb(gain, loss) if size >= rsi_n else np.nan
+    prev_rsi = _rsi_from_averages_nb(prev_gain, prev_loss) if size > rsi_n else np.nan
+    return (
+        prev_fast if size > fast_n else np.nan,
+        prev_slow if size > slow_n else np.nan,
+        fast if size >= fast_n else np.nan,
+        slow if size >= slow_n else np.nan,
+        prev_rsi,
+        rsi,
+        gain,
+        loss,
+        atr_value if size >= atr_n else np.nan,
+    )
+
+
+# Compile the kernels at import so the first trading signal doesn't pay for the JIT
+_warmup = np.array([1.0, 2.0])
+combined(_warmup, _warmup, _warmup, 2, 2, 2, 2)
+del _warmup
\ No newline at end of file
@@ -1,21 +1,117 @@
 import logging
 import math
+import time
+from functools import lru_cache
 from modules.config import (
     INITIAL_BALANCE, RISK_PER_TRADE, MAX_OPEN_POSITIONS,
-    USE_STOP_LOSS, STOP_LOSS_PCT, USE_TAKE_PROFIT, 
+    KELLY_FRACTION, KELLY_CAP, KELLY_MIN_RISK,
+    USE_STOP_LOSS, STOP_LOSS_PCT, ATR_STOP_MULT, USE_TAKE_PROFIT, 
     TAKE_PROFIT_PCT, TRAILING_STOP, TRAILING_STOP_PCT,
-    AUTO_COMPOUND, COMPOUND_REINVEST_PERCENT
+    AUTO_COMPOUND, COMPOUND_REINVEST_PERCENT,
+    SYMBOL_INFO_CACHE_TTL, POSITION_INFO_CACHE_TTL
 )
 
 logger = logging.getLogger(__name__)
 
+# Guards the Kelly fraction against a zero variance estimate
+KELLY_EPS = 1e-12
+
 class RiskManager:
-    def __init__(self, binance_client):
-        """Initialize risk manager with a reference to binance client"""
+    def __init__(self, binance_client, strategy=None):
+        """Initialize risk manager with a reference to binance client and optionally the strategy"""
         self.binance_client = binance_client
+        self.strategy = strategy
         self.initial_balance = None
         self.last_known_balance = None
         
+        # Caches of (timestamp, value) keyed by symbol to avoid repeated REST calls
+        self._symbol_info_cache = {}
+        # Time of the last bulk load of every symbol's info
+        self._symbol_info_loaded_at = float('-inf')
+        self._position_info_cache = {}
+        self._positions_cache = (0.0, None)
+        self._balance_cache = (0.0, None)
+        
+        # Stop loss price placed for each symbol's open position, used by the trailing stop
+        self._stop_losses = {}
+        
+    def _get_balance(self, max_age=0.5):
+        """Get account balance, reusing a snapshot younger than max_age seconds"""
+        timestamp, balance = self._balance_cache
+        if balance is not None and time.monotonic() - timestamp < max_age:
+            return balance
+            
+        balance = self.binance_client.get_account_balance()
+        self._balance_cache = (time.monotonic(), balance)
+        return balance
+        
+    def invalidate_balance(self):
+        """Drop the cached balance, e.g. after an order has been placed"""
+        self._balance_cache = (0.0, None)
+        
+    def load_all_symbol_info(self):
+        """Fill the symbol info cache for every symbol with one exchange info request"""
+        all_symbol_info = self.binance_client.load_all_symbol_info()
+        if not all_symbol_info:
+            return False
+            
+        now = time.monotonic()
+        self._symbol_info_cache.update((symbol, (now, info)) for symbol, info in all_symbol_info.items())
+        self._symbol_info_loaded_at = now
+        return True
+        
+    def _get_symbol_info(self, symbol):
+        """Get symbol info, fetching from the exchange only if the cached copy is stale"""
+        cached = self._symbol_info_cache.get(symbol)
+        if cached and time.monotonic() - cached[0] < SYMBOL_INFO_CACHE_TTL:
+            return cached[1]
+            
+        # Refresh every symbol at once when the bulk load is stale, otherwise
+        # (e.g. after invalidate_symbol) fall back to a single symbol lookup
+        if time.monotonic() - self._symbol_info_loaded_at >= SYMBOL_INFO_CACHE_TTL and self.load_all_symbol_info():
+            cached = self._symbol_info_cache.get(symbol)
+            if cached:
+                return cached[1]
+                
+        symbol_info = self.binance_client.get_symbol_info(symbol)
+        # Don't cache failed lookups so the next call retries
+        if symbol_info:
+            self._symbol_info_cache[symbol] = (time.monotonic(), symbol_info)
+        return symbol_info
+        
+    def invalidate_symbol(self, symbol):
+        """Drop cached symbol info, e.g. after exchange filters change"""
+        self._symbol_info_cache.pop(symbol, None)
+        
+    def _get_position_info(self, symbol):
+        """Get position info, reusing a very recent result for the same symbol"""
+        cached = self._position_info_cache.get(symbol)
+        if cached and time.monotonic() - cached[0] < POSITION_INFO_CACHE_TTL:
+            return cached[1]
+            
+        position_info = self.binance_client.get_position_info(symbol)
+        # Don't cache failed lookups so the next call retries
+        if position_info is not None:
+            self._position_info_cache[symbol] = (time.monotonic(), position_info)
+        return position_info
+        
+    def _get_positions(self):
+        """Get the raw futures positions list, shared by checks in the same cycle"""
+        timestamp, positions = self._positions_cache
+        if positions is not None and time.monotonic() - timestamp < POSITION_INFO_CACHE_TTL:
+            return positions
+            
+        positions = self.binance_client.get_all_positions()
+        # Don't cache failed lookups so the next call retries
+        if positions is not None:
+            self._positions_cache = (time.monotonic(), positions)
+        return positions
+        
+    def invalidate_positions(self):
+        """Drop cached position info, e.g. after an order has been placed"""
+        self._position_info_cache.clear()
+        self._positions_cache = (0.0, None)
+        
     def calculate_position_size(self, symbol, side, price, stop_loss_price=None):
         """
         Calculate position size based on risk parameters
@@ -30,7 +126,7 @@ class RiskManager:
             quantity: The position size
         """
         # Get account balance
-        balance = self.binance_client.get_account_balance()
+        balance = self._get_balance()
         
         # Initialize initial balance if not set
         if self.initial_balance is None:
@@ -51,28 +147,38 @@ class RiskManager:
             return 0
             
         # Get symbol info for precision
-        symbol_info = self.binance_client.get_symbol_info(symbol)
+        symbol_info = self._get_symbol_info(symbol)
         if not symbol_info:
             logger.error(f"Could not retrieve symbol info for {symbol}")
             return 0
             
-        # Calculate risk amount
-        risk_amount = balance * RISK_PER_TRADE
-        
-        # Calculate position size based on risk and stop loss
-        if stop_loss_price and USE_STOP_LOSS:
-            # If stop loss is provided, calculate size based on it
+        # Fraction of the entry notional that is at risk: the move to the stop loss,
+        # or the inverse leverage when the risk amount is sized up by leverage
+        use_stop = stop_loss_price and USE_STOP_LOSS
+        if use_stop:
             risk_per_unit = abs(price - stop_loss_price)
             if risk_per_unit <= 0:
                 logger.error("Stop loss too close to entry price")
                 return 0
-                
-            # Calculate max quantity based on risk
+            loss_per_notional = risk_per_unit / price
+        else:
+            leverage = self.get_current_leverage(symbol)
+            loss_per_notional = 1 / leverage
+            
+        # Calculate risk amount
+        risk_fraction = self.get_risk_fraction(symbol, loss_per_notional)
+        if risk_fraction <= 0:
+            logger.info(f"No positive edge for {symbol} and KELLY_MIN_RISK is 0 - skipping position")
+            return 0
+        risk_amount = balance * risk_fraction
+        
+        # Calculate position size based on risk and stop loss
+        if use_stop:
+            # If stop loss is provided, calculate size based on it
             max_quantity = risk_amount / risk_per_unit
         else:
             # If no stop loss, use a percentage of balance with leverage
-            leverage = self.get_current_leverage(symbol)
-            max_quantity = (balance * RISK_PER_TRADE * leverage) / price
+            max_quantity = (risk_amount * leverage) / price
         
         # Apply precision to quantity
         quantity_precision = symbol_info['quantity_precision']
@@ -83,7 +189,8 @@ class RiskManager:
         if quantity * price < min_notional:
             logger.warning(f"Position size too small - below minimum notional of {min_notional}")
             if min_notional / price <= max_quantity:
-                quantity = math.ceil(min_notional / price * 10**quantity_precision) / 10**quantity_precision
+                scale = _pow10(quantity_precision)
+                quantity = math.ceil(min_notional / price * scale) / scale
                 logger.info(f"Adjusted position size to meet minimum notional: {quantity}")
             else:
                 logger.error(f"Cannot meet minimum notional with current risk settings")
@@ -92,32 +199,73 @@ class RiskManager:
         logger.info(f"Calculated position size: {quantity} units at {price} per unit")
         return quantity
         
+    def get_risk_fraction(self, symbol, loss_per_notional):
+        """
+        Fraction of the balance to risk on the next trade.
+        Trade returns are measured per unit of entry notional, so fractional
+        Kelly (mu / sigma^2 scaled by KELLY_FRACTION) is the notional to hold as
+        a fraction of the balance. Multiplied by the fraction of the notional at
+        risk (loss_per_notional) it becomes the fraction of the balance at risk,
+        capped at KELLY_CAP. Falls back to RISK_PER_TRADE while there is no edge
+        estimate yet, and never goes below KELLY_MIN_RISK so a symbol whose edge
+        turned negative keeps producing returns that can revive the estimate.
+        """
+        if self.strategy is None:
+            return RISK_PER_TRADE
+            
+        mu, sigma2 = self.strategy.estimate_edge(symbol)
+        if sigma2 is None:
+            return RISK_PER_TRADE
+            
+        exposure = KELLY_FRACTION * mu / max(sigma2, KELLY_EPS)
+        kelly_f = max(KELLY_MIN_RISK, min(KELLY_CAP, exposure * loss_per_notional))
+        logger.info(f"Fractional Kelly risk for {symbol}: {kelly_f:.4f} (mu={mu:.5f}, sigma2={sigma2:.6f})")
+        return kelly_f
+        
     def get_current_leverage(self, symbol):
         """Get the current leverage for a symbol"""
-        position_info = self.binance_client.get_position_info(symbol)
+        position_info = self._get_position_info(symbol)
         if position_info:
             return position_info['leverage']
         return 1  # Default to 1x if no position info
         
     def should_open_position(self, symbol):
         """Check if a new position should be opened based on risk rules"""
+        # Single pass over all positions for both the symbol and the open count
+        positions = self._get_positions()
+        if positions is None:
+            logger.error(f"Could not fetch positions, not opening a position for {symbol}")
+            return False
+            
+        open_positions = 0
+        symbol_position_amount = None
+        for p in positions:
+            position_amount = float(p['positionAmt'])
+            if position_amount != 0:
+                open_positions += 1
+            # The first entry for the symbol counts, as in get_position_info
+            if symbol_position_amount is None and p['symbol'] == symbol:
+                symbol_position_amount = position_amount
+                
         # Check if we already have an open position
-        position_info = self.binance_client.get_position_info(symbol)
-        if position_info and abs(position_info['position_amount']) > 0:
+        if symbol_position_amount:
             logger.info(f"Already have an open position for {symbol}")
             return False
             
         # Check maximum number of open positions
-        positions = self.binance_client.client.futures_position_information()
-        open_positions = [p for p in positions if float(p['positionAmt']) != 0]
-        if len(open_positions) >= MAX_OPEN_POSITIONS:
+        if open_positions >= MAX_OPEN_POSITIONS:
             logger.info(f"Maximum number of open positions ({MAX_OPEN_POSITIONS}) reached")
             return False
             
         return True
         
-    def calculate_stop_loss(self, symbol, side, entry_price):
-        """Calculate stop loss price based on configuration"""
+    def calculate_stop_loss(self, symbol, side, entry_price, atr_value=None):
+        """
+        Calculate stop loss price based on configuration.
+        With atr_value the stop is ATR_STOP_MULT ATRs away from the entry
+        instead of STOP_LOSS_PCT, as long as it lands strictly on the loss side
+        of the entry after rounding.
+        """
         if not USE_STOP_LOSS:
             return None
             
@@ -127,11 +275,23 @@ class RiskManager:
             stop_price = entry_price * (1 + STOP_LOSS_PCT)
             
         # Apply price precision
-        symbol_info = self.binance_client.get_symbol_info(symbol)
+        symbol_info = self._get_symbol_info(symbol)
         if symbol_info:
             price_precision = symbol_info['price_precision']
             stop_price = round(stop_price, price_precision)
             
+        if atr_value:
+            stop_distance = ATR_STOP_MULT * atr_value
+            atr_stop_price = entry_price - stop_distance if side == "BUY" else entry_price + stop_distance
+            if symbol_info:
+                atr_stop_price = round(atr_stop_price, price_precision)
+                
+            # A NaN, zero-width or (for longs) non-positive ATR stop keeps the percentage stop
+            if (0 < atr_stop_price < entry_price) if side == "BUY" else (atr_stop_price > entry_price):
+                stop_price = atr_stop_price
+            else:
+                logger.warning(f"ATR stop {atr_stop_price} is not on the loss side of {entry_price}, using {stop_price}")
+                
         logger.info(f"Calculated stop loss at {stop_price}")
         return stop_price
         
@@ -146,7 +306,7 @@ class RiskManager:
             take_profit_price = entry_price * (1 - TAKE_PROFIT_PCT)
             
         # Apply price precision
-        symbol_info = self.binance_client.get_symbol_info(symbol)
+        symbol_info = self._get_symbol_info(symbol)
         if symbol_info:
             price_precision = symbol_info['price_precision']
             take_profit_price = round(take_profit_price, price_precision)
@@ -160,42 +320,53 @@ class RiskManager:
             return None
             
         if not position_info:
-            position_info = self.binance_client.get_position_info(symbol)
+            position_info = self._get_position_info(symbol)
             
         if not position_info or abs(position_info['position_amount']) == 0:
             return None
             
         entry_price = position_info['entry_price']
+        symbol_info = self._get_symbol_info(symbol)
+        price_precision = symbol_info['price_precision'] if symbol_info else None
         
         # Calculate new stop loss based on current price
         if side == "BUY":  # Long position
             new_stop = current_price * (1 - TRAILING_STOP_PCT)
-            # Only move stop loss up, never down
-            current_stop = self.calculate_stop_loss(symbol, side, entry_price)
-            if current_stop and new_stop <= current_stop:
-                return None
         else:  # Short position
             new_stop = current_price * (1 + TRAILING_STOP_PCT)
-            # Only move stop loss down, never up
-            current_stop = self.calculate_stop_loss(symbol, side, entry_price)
-            if current_stop and new_stop >= current_stop:
-                return None
+            
+        # Compare against the stop that was actually placed (entry, ATR or trailed stop)
+        current_stop = self._stop_losses.get(symbol)
+        if current_stop is None and USE_STOP_LOSS:
+            # Nothing recorded, e.g. after a restart: assume the percentage stop from the entry
+            if side == "BUY":
+                current_stop = entry_price * (1 - STOP_LOSS_PCT)
+            else:
+                current_stop = entry_price * (1 + STOP_LOSS_PCT)
+            if price_precision is not None:
+                current_stop = round(current_stop, price_precision)
                 
+        # Only move stop loss up for longs and down for shorts
+        if current_stop and (new_stop <= current_stop if side == "BUY" else new_stop >= current_stop):
+            return None
+            
         # Apply price precision
-        symbol_info = self.binance_client.get_symbol_info(symbol)
-        if symbol_info:
-            price_precision = symbol_info['price_precision']
+        if price_precision is not None:
             new_stop = round(new_stop, price_precision)
             
         logger.info(f"Adjusted trailing stop loss to {new_stop}")
         return new_stop
         
+    def record_stop_loss(self, symbol, stop_price):
+        """Remember the stop loss placed for symbol's position (None if there is none)"""
+        self._stop_losses[symbol] = stop_price
+        
     def update_balance_for_compounding(self):
         """Update balance tracking for auto-compounding"""
         if not AUTO_COMPOUND:
             return False
             
-        current_balance = self.binance_client.get_account_balance()
+        current_balance = self._get_balance()
         
         # First time initialization
         if self.last_known_balance is None:
@@ -215,10 +386,23 @@ class RiskManager:
         return False
 
 
+@lru_cache(maxsize=None)
+def _pow10(precision):
+    """10 ** precision, cached since precisions are fixed per symbol"""
+    return 10**precision
+
+
+@lru_cache(maxsize=None)
+def _precision_pow(step_size):
+    """Decimal precision of a step size and the matching power of ten"""
+    precision = int(round(-math.log10(step_size)))
+    return precision, _pow10(precision)
+
+
 def round_step_size(quantity, step_size):
     """Round quantity based on step size"""
-    precision = int(round(-math.log10(step_size)))
-    return round(math.floor(quantity * 10**precision) / 10**precision, precision)
+    precision, scale = _precision_pow(step_size)
+    return round(math.floor(quantity * scale) / scale, precision)
 
 
 def get_step_size(min_qty):
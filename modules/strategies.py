@@ -1,211 +1,395 @@
 import logging
+import math
 import numpy as np
-import pandas as pd
-import ta
 from modules.config import (
     RSI_PERIOD, RSI_OVERBOUGHT, RSI_OVERSOLD,
-    FAST_EMA, SLOW_EMA
+    FAST_EMA, SLOW_EMA, ATR_PERIOD, KELLY_MIN_TRADES, KELLY_EWMA_ALPHA
 )
+from modules.indicators_nb import combined, rsi_from_averages, true_range
 
 logger = logging.getLogger(__name__)
 
+# Signal lookup indexed by the packed crossing flags from signal_state():
+# BUY when the buy condition holds now but not before, likewise for SELL
+SIGNAL_TABLE = np.array([
+    None, None, "SELL", None,   # buy_now=0, buy_prev=0
+    None, None, "SELL", None,   # buy_now=0, buy_prev=1
+    "BUY", "BUY", "BUY", "BUY", # buy_now=1, buy_prev=0
+    None, None, "SELL", None,   # buy_now=1, buy_prev=1
+], dtype=object)
+
+# Codes of SIGNAL_TABLE entries, used to index COMBINED_SIGNAL_TABLE
+SIGNAL_CODES = {None: 0, "BUY": 1, "SELL": 2}
+
+# RSI_EMA signal indexed by [rsi_code][ema_code]: the RSI signal wins unless EMA disagrees
+COMBINED_SIGNAL_TABLE = (
+    (None, None, None),
+    ("BUY", "BUY", None),
+    ("SELL", None, "SELL"),
+)
+
+
+def signal_state(buy_now, buy_prev, sell_now, sell_prev):
+    """Pack the four crossing conditions into a SIGNAL_TABLE index"""
+    return (int(buy_now) << 3) | (int(buy_prev) << 2) | (int(sell_now) << 1) | int(sell_prev)
+
+
+# Bollinger Bands settings, shared by BollingerBandsStrategy and SymbolState
+BB_WINDOW = 20
+BB_WINDOW_DEV = 2.0
+
+# Closes kept per symbol and the history needed before updates become incremental
+STATE_SIZE = max(SLOW_EMA, RSI_PERIOD * 2, BB_WINDOW) + 2
+STATE_MIN_HISTORY = max(FAST_EMA, SLOW_EMA, RSI_PERIOD, BB_WINDOW, ATR_PERIOD)
+
+
+def _bands(window_closes):
+    """Lower and upper band for one window of closes, NaN until the window is full"""
+    if window_closes.size < BB_WINDOW:
+        return np.nan, np.nan
+    mean = window_closes.mean()
+    # Population standard deviation, matching ta's BollingerBands
+    std = window_closes.std()
+    return mean - BB_WINDOW_DEV * std, mean + BB_WINDOW_DEV * std
+
+
+class SymbolState:
+    """
+    Indicator state of one symbol: a preallocated ring buffer of the newest
+    closes plus the last two values of every indicator, the latest ATR and the
+    scalar state of their recurrences, so a new candle is folded in without
+    touching the history.
+    """
+    def __init__(self, size=STATE_SIZE):
+        self.closes = np.zeros(size, dtype=np.float64)
+        # Slot the next close is written to, the newest close is at head - 1
+        self.head = 0
+        # Close time of the newest candle, None while updates can't be incremental
+        self.last_close_time = None
+        
+        self.prev_ema_fast = self.ema_fast = np.nan
+        self.prev_ema_slow = self.ema_slow = np.nan
+        # Wilder smoothed average gain/loss behind the RSI
+        self.avg_gain = self.avg_loss = np.nan
+        self.prev_rsi = self.rsi = np.nan
+        # Wilder average true range, used for volatility-scaled stops
+        self.atr = np.nan
+        # Running sums over the last BB_WINDOW closes
+        self.window_sum = self.window_sum_sq = 0.0
+        self.prev_bb_low = self.bb_low = np.nan
+        self.prev_bb_high = self.bb_high = np.nan
+        
+    def close_ago(self, n):
+        """Close n candles before the newest one"""
+        return float(self.closes[self.head - 1 - n])
+        
+    def reset(self, close, high, low, close_time):
+        """Rebuild the state from full float64 close, high and low histories"""
+        (self.prev_ema_fast, self.prev_ema_slow, self.ema_fast, self.ema_slow,
+         self.prev_rsi, self.rsi, self.avg_gain, self.avg_loss, self.atr) = combined(
+            close, high, low, FAST_EMA, SLOW_EMA, RSI_PERIOD, ATR_PERIOD
+        )
+        
+        # Bollinger Bands only need the last window + 1 closes
+        tail = close[-(BB_WINDOW + 1):]
+        self.prev_bb_low, self.prev_bb_high = _bands(tail[:-1])
+        self.bb_low, self.bb_high = _bands(tail[-BB_WINDOW:])
+        window = tail[-BB_WINDOW:].tolist()
+        self.window_sum = sum(window)
+        self.window_sum_sq = sum(c * c for c in window)
+        
+        recent = close[-self.closes.size:]
+        self.closes[:recent.size] = recent
+        self.head = recent.size % self.closes.size
+        # Incremental updates are only enabled once every indicator is defined
+        self.last_close_time = close_time if close.size > STATE_MIN_HISTORY else None
+        
+    def push(self, close, high, low, close_time):
+        """Overwrite the oldest close with a new one and step every indicator, O(1)"""
+        prev_close = self.closes[self.head - 1]
+        change = close - prev_close
+        oldest = self.closes[self.head - BB_WINDOW]
+        self.closes[self.head] = close
+        self.head = (self.head + 1) % self.closes.size
+        self.last_close_time = close_time
+        
+        fast_alpha = 2 / (FAST_EMA + 1)
+        slow_alpha = 2 / (SLOW_EMA + 1)
+        self.prev_ema_fast, self.ema_fast = self.ema_fast, (1 - fast_alpha) * self.ema_fast + fast_alpha * close
+        self.prev_ema_slow, self.ema_slow = self.ema_slow, (1 - slow_alpha) * self.ema_slow + slow_alpha * close
+        
+        rsi_alpha = 1 / RSI_PERIOD
+        self.avg_gain = (1 - rsi_alpha) * self.avg_gain + rsi_alpha * max(change, 0.0)
+        self.avg_loss = (1 - rsi_alpha) * self.avg_loss + rsi_alpha * max(-change, 0.0)
+        self.prev_rsi, self.rsi = self.rsi, rsi_from_averages(self.avg_gain, self.avg_loss)
+        
+        self.atr = (self.atr * (ATR_PERIOD - 1) + true_range(high, low, prev_close)) / ATR_PERIOD
+        
+        self.window_sum += close - oldest
+        self.window_sum_sq += close * close - oldest * oldest
+        mean = self.window_sum / BB_WINDOW
+        # Population standard deviation, matching ta's BollingerBands
+        std = math.sqrt(max(self.window_sum_sq / BB_WINDOW - mean * mean, 0.0))
+        self.prev_bb_low, self.prev_bb_high = self.bb_low, self.bb_high
+        self.bb_low = mean - BB_WINDOW_DEV * std
+        self.bb_high = mean + BB_WINDOW_DEV * std
+
+
+# Indicator state per symbol, shared by all strategies trading that symbol
+_SYMBOL_STATES = {}
+
+
 class TradingStrategy:
     """Base class for trading strategies"""
     def __init__(self, strategy_name):
         self.strategy_name = strategy_name
+        # Per symbol (trade count, EWMA of trade returns, EWMA of squared returns)
+        self._edge = {}
+        
+    def record_trade_return(self, symbol, trade_return):
+        """Record a realized trade return (PnL as a fraction of the entry notional)"""
+        count, mean, mean_sq = self._edge.get(symbol, (0, 0.0, 0.0))
+        if count == 0:
+            mean, mean_sq = trade_return, trade_return * trade_return
+        else:
+            mean = (1 - KELLY_EWMA_ALPHA) * mean + KELLY_EWMA_ALPHA * trade_return
+            mean_sq = (1 - KELLY_EWMA_ALPHA) * mean_sq + KELLY_EWMA_ALPHA * trade_return * trade_return
+        self._edge[symbol] = (count + 1, mean, mean_sq)
+        
+    def estimate_edge(self, symbol):
+        """
+        Return (mu, sigma2), the EWMA mean and variance of recent trade returns.
+        Both are None until KELLY_MIN_TRADES trades have been recorded.
+        """
+        count, mean, mean_sq = self._edge.get(symbol, (0, 0.0, 0.0))
+        if count < KELLY_MIN_TRADES:
+            return None, None
+        return mean, max(mean_sq - mean * mean, 0.0)
+        
+    def extract_close(self, klines):
+        """
+        Extract close prices as a float64 array. Accepts raw klines (list or deque)
+        or typed kline arrays (a dict of NumPy columns), which are used as is.
+        """
+        if isinstance(klines, dict):
+            return klines['close']
+        return np.asarray([float(k[4]) for k in klines], dtype=np.float64)
+        
+    def extract_high_low(self, klines):
+        """Extract high and low prices as float64 arrays, like extract_close"""
+        if isinstance(klines, dict):
+            return klines['high'], klines['low']
+        high = np.asarray([float(k[2]) for k in klines], dtype=np.float64)
+        low = np.asarray([float(k[3]) for k in klines], dtype=np.float64)
+        return high, low
+        
+    def _candle_count(self, klines):
+        """Number of candles in raw klines or typed kline arrays"""
+        if isinstance(klines, dict):
+            return klines['close'].size
+        return len(klines)
+        
+    def _close_at(self, klines, index):
+        """Close price of one candle in raw klines or typed kline arrays"""
+        if isinstance(klines, dict):
+            return float(klines['close'][index])
+        return float(klines[index][4])
+        
+    def _high_low_at(self, klines, index):
+        """High and low price of one candle in raw klines or typed kline arrays"""
+        if isinstance(klines, dict):
+            return float(klines['high'][index]), float(klines['low'][index])
+        return float(klines[index][2]), float(klines[index][3])
         
-    def prepare_data(self, klines):
-        """Convert raw klines to a DataFrame with OHLCV data"""
-        df = pd.DataFrame(klines, columns=[
-            'open_time', 'open', 'high', 'low', 'close', 'volume',
-            'close_time', 'quote_asset_volume', 'number_of_trades',
-            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-        ])
-        
-        # Convert string values to numeric
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = pd.to_numeric(df[col])
+    def _close_time_at(self, klines, index):
+        """Close time of one candle in raw klines or typed kline arrays"""
+        if isinstance(klines, dict):
+            return klines['close_time'][index]
+        return klines[index][6]
+        
+    def _is_next_candle(self, klines, state):
+        """True if exactly one candle was appended since the last update"""
+        return (
+            state.last_close_time is not None
+            and self._candle_count(klines) >= 2
+            and self._close_time_at(klines, -2) == state.last_close_time
+        )
+        
+    def update_state(self, klines, symbol=None):
+        """
+        Bring the SymbolState of symbol up to date with klines and return it.
+        A single appended candle is pushed into the state, any other change of
+        the history rebuilds it. A candle the state already holds, e.g. after
+        another strategy was asked about the same symbol, leaves it untouched.
+        """
+        state = _SYMBOL_STATES.get(symbol)
+        if state is None:
+            state = _SYMBOL_STATES[symbol] = SymbolState()
             
-        # Convert timestamps to datetime
-        df['open_time'] = pd.to_datetime(df['open_time'], unit='ms')
-        df['close_time'] = pd.to_datetime(df['close_time'], unit='ms')
+        close_time = self._close_time_at(klines, -1)
+        close = self._close_at(klines, -1)
+        if state.last_close_time is not None and close_time == state.last_close_time and close == state.close_ago(0):
+            return state
+        if self._is_next_candle(klines, state):
+            state.push(close, *self._high_low_at(klines, -1), close_time)
+        else:
+            state.reset(self.extract_close(klines), *self.extract_high_low(klines), close_time)
+        return state
         
-        return df
-    
-    def get_signal(self, klines):
+    def get_atr(self, symbol=None):
+        """Latest ATR of symbol as of the last get_signal call, None if unknown"""
+        state = _SYMBOL_STATES.get(symbol)
+        if state is None or math.isnan(state.atr):
+            return None
+        return state.atr
+        
+    def get_signal(self, klines, symbol=None):
         """
         Should be implemented by subclasses.
-        Returns 'BUY', 'SELL', or None.
+        Returns 'BUY', 'SELL', or None. symbol selects the SymbolState that is
+        updated incrementally between calls.
         """
         raise NotImplementedError("Each strategy must implement get_signal method")
 
 
 class RSIStrategy(TradingStrategy):
     """Simple RSI-based strategy"""
+    signal_messages = {
+        "BUY": "RSI Strategy: BUY signal - RSI crossed below oversold level ({rsi:.2f})",
+        "SELL": "RSI Strategy: SELL signal - RSI crossed above overbought level ({rsi:.2f})",
+    }
+    
     def __init__(self):
         super().__init__('RSI')
         self.rsi_period = RSI_PERIOD
         self.rsi_overbought = RSI_OVERBOUGHT
         self.rsi_oversold = RSI_OVERSOLD
         
-    def get_signal(self, klines):
-        df = self.prepare_data(klines)
-        
-        # Calculate RSI
-        df['rsi'] = ta.momentum.RSIIndicator(
-            close=df['close'], 
-            window=self.rsi_period
-        ).rsi()
-        
-        # Get the last two RSI values to check for crossing
-        last_rsi = df['rsi'].iloc[-1]
-        prev_rsi = df['rsi'].iloc[-2]
-        
-        # Generate signals
-        if last_rsi < self.rsi_oversold and prev_rsi >= self.rsi_oversold:
-            logger.info(f"RSI Strategy: BUY signal - RSI crossed below oversold level ({last_rsi:.2f})")
-            return "BUY"
-        elif last_rsi > self.rsi_overbought and prev_rsi <= self.rsi_overbought:
-            logger.info(f"RSI Strategy: SELL signal - RSI crossed above overbought level ({last_rsi:.2f})")
-            return "SELL"
-        else:
-            return None
+    def get_signal(self, klines, symbol=None):
+        state = self.update_state(klines, symbol)
+        return self._signal_from_values(state.prev_rsi, state.rsi)
+        
+    def _signal_from_values(self, prev_rsi, last_rsi):
+        """Generate a signal from the last two RSI values"""
+        # BUY when RSI crosses below oversold, SELL when it crosses above overbought
+        signal = SIGNAL_TABLE[signal_state(
+            last_rsi < self.rsi_oversold, not prev_rsi >= self.rsi_oversold,
+            last_rsi > self.rsi_overbought, not prev_rsi <= self.rsi_overbought
+        )]
+        if signal is not None:
+            logger.info(self.signal_messages[signal].format(rsi=last_rsi))
+        return signal
 
 
 class EMAStrategy(TradingStrategy):
     """EMA Crossover strategy"""
+    signal_messages = {
+        "BUY": "EMA Strategy: BUY signal - Fast EMA crossed above Slow EMA",
+        "SELL": "EMA Strategy: SELL signal - Fast EMA crossed below Slow EMA",
+    }
+    
     def __init__(self):
         super().__init__('EMA_Cross')
         self.fast_ema = FAST_EMA
         self.slow_ema = SLOW_EMA
         
-    def get_signal(self, klines):
-        df = self.prepare_data(klines)
-        
-        # Calculate EMAs
-        df['fast_ema'] = ta.trend.EMAIndicator(
-            close=df['close'], 
-            window=self.fast_ema
-        ).ema_indicator()
-        
-        df['slow_ema'] = ta.trend.EMAIndicator(
-            close=df['close'], 
-            window=self.slow_ema
-        ).ema_indicator()
-        
-        # Check for crossovers
-        current_fast = df['fast_ema'].iloc[-1]
-        current_slow = df['slow_ema'].iloc[-1]
-        prev_fast = df['fast_ema'].iloc[-2]
-        prev_slow = df['slow_ema'].iloc[-2]
-        
-        # Generate signals
-        if current_fast > current_slow and prev_fast <= prev_slow:
-            logger.info(f"EMA Strategy: BUY signal - Fast EMA crossed above Slow EMA")
-            return "BUY"
-        elif current_fast < current_slow and prev_fast >= prev_slow:
-            logger.info(f"EMA Strategy: SELL signal - Fast EMA crossed below Slow EMA")
-            return "SELL"
-        else:
-            return None
+    def get_signal(self, klines, symbol=None):
+        state = self.update_state(klines, symbol)
+        return self._signal_from_values(state.prev_ema_fast, state.prev_ema_slow, state.ema_fast, state.ema_slow)
+        
+    def _signal_from_values(self, prev_fast, prev_slow, current_fast, current_slow):
+        """Generate a signal from the last two fast and slow EMA values"""
+        # BUY when fast crosses above slow, SELL when it crosses below
+        signal = SIGNAL_TABLE[signal_state(
+            current_fast > current_slow, not prev_fast <= prev_slow,
+            current_fast < current_slow, not prev_fast >= prev_slow
+        )]
+        if signal is not None:
+            logger.info(self.signal_messages[signal])
+        return signal
 
 
 class RSIEMAStrategy(TradingStrategy):
     """Combined RSI and EMA strategy"""
+    signal_messages = {
+        "BUY": "RSI_EMA Strategy: Strong BUY signal - Both indicators align",
+        "SELL": "RSI_EMA Strategy: Strong SELL signal - Both indicators align",
+    }
+    
     def __init__(self):
         super().__init__('RSI_EMA')
         self.rsi_strategy = RSIStrategy()
         self.ema_strategy = EMAStrategy()
         
-    def get_signal(self, klines):
-        df = self.prepare_data(klines)
-        
-        # Calculate RSI
-        df['rsi'] = ta.momentum.RSIIndicator(
-            close=df['close'], 
-            window=RSI_PERIOD
-        ).rsi()
-        
-        # Calculate EMAs
-        df['fast_ema'] = ta.trend.EMAIndicator(
-            close=df['close'], 
-            window=FAST_EMA
-        ).ema_indicator()
-        
-        df['slow_ema'] = ta.trend.EMAIndicator(
-            close=df['close'], 
-            window=SLOW_EMA
-        ).ema_indicator()
+    def get_signal(self, klines, symbol=None):
+        # Both indicators come from the same SymbolState update
+        state = self.update_state(klines, symbol)
         
         # Check both indicators
-        rsi_signal = self.rsi_strategy.get_signal(klines)
-        ema_signal = self.ema_strategy.get_signal(klines)
-        
-        # Only return BUY if both strategies agree or if EMA gives buy and RSI is not selling
-        if rsi_signal == "BUY" and (ema_signal == "BUY" or ema_signal is None):
-            logger.info("RSI_EMA Strategy: Strong BUY signal - Both indicators align")
-            return "BUY"
-        # Only return SELL if both strategies agree or if EMA gives sell and RSI is not buying
-        elif rsi_signal == "SELL" and (ema_signal == "SELL" or ema_signal is None):
-            logger.info("RSI_EMA Strategy: Strong SELL signal - Both indicators align")
-            return "SELL"
-        else:
-            return None
+        return self._combine_signals(
+            self.rsi_strategy._signal_from_values(state.prev_rsi, state.rsi),
+            self.ema_strategy._signal_from_values(
+                state.prev_ema_fast, state.prev_ema_slow, state.ema_fast, state.ema_slow
+            )
+        )
+        
+    def _combine_signals(self, rsi_signal, ema_signal):
+        """Combine the RSI and EMA signals into the RSI_EMA signal"""
+        # RSI signal only counts if EMA agrees or is neutral
+        signal = COMBINED_SIGNAL_TABLE[SIGNAL_CODES[rsi_signal]][SIGNAL_CODES[ema_signal]]
+        if signal is not None:
+            logger.info(self.signal_messages[signal])
+        return signal
 
 
 class BollingerBandsStrategy(TradingStrategy):
     """Bollinger Bands strategy"""
+    signal_messages = {
+        "BUY": "BB Strategy: BUY signal - Price crossed below lower band",
+        "SELL": "BB Strategy: SELL signal - Price crossed above upper band",
+    }
+    
     def __init__(self):
         super().__init__('Bollinger_Bands')
-        self.window = 20
-        self.window_dev = 2.0
-        
-    def get_signal(self, klines):
-        df = self.prepare_data(klines)
+        self.window = BB_WINDOW
+        self.window_dev = BB_WINDOW_DEV
         
-        # Calculate Bollinger Bands
-        indicator_bb = ta.volatility.BollingerBands(
-            close=df["close"], 
-            window=self.window, 
-            window_dev=self.window_dev
+    def get_signal(self, klines, symbol=None):
+        state = self.update_state(klines, symbol)
+        return self._signal_from_values(
+            state.close_ago(1), state.prev_bb_low, state.prev_bb_high,
+            state.close_ago(0), state.bb_low, state.bb_high
         )
         
-        df['bb_high'] = indicator_bb.bollinger_hband()
-        df['bb_low'] = indicator_bb.bollinger_lband()
-        df['bb_mid'] = indicator_bb.bollinger_mavg()
-        
-        # Get current price and bands
-        current_price = df['close'].iloc[-1]
-        current_bb_low = df['bb_low'].iloc[-1]
-        current_bb_high = df['bb_high'].iloc[-1]
-        
-        # Previous values
-        prev_price = df['close'].iloc[-2]
-        prev_bb_low = df['bb_low'].iloc[-2]
-        prev_bb_high = df['bb_high'].iloc[-2]
-        
-        # Generate signals
-        if current_price < current_bb_low and prev_price >= prev_bb_low:
-            logger.info(f"BB Strategy: BUY signal - Price crossed below lower band")
-            return "BUY"
-        elif current_price > current_bb_high and prev_price <= prev_bb_high:
-            logger.info(f"BB Strategy: SELL signal - Price crossed above upper band")
-            return "SELL"
-        else:
-            return None
+    def _signal_from_values(self, prev_price, prev_bb_low, prev_bb_high,
+                            current_price, current_bb_low, current_bb_high):
+        """Generate a signal from the last two prices and band values"""
+        # BUY when price crosses below the lower band, SELL when it crosses above the upper band
+        signal = SIGNAL_TABLE[signal_state(
+            current_price < current_bb_low, not prev_price >= prev_bb_low,
+            current_price > current_bb_high, not prev_price <= prev_bb_high
+        )]
+        if signal is not None:
+            logger.info(self.signal_messages[signal])
+        return signal
+
+
+# Strategy instances shared by all get_strategy() calls, created on first use
+_STRATEGIES = {}
 
 
 def get_strategy(strategy_name):
     """Factory function to get a strategy by name"""
-    strategies = {
-        'RSI': RSIStrategy(),
-        'EMA_Cross': EMAStrategy(),
-        'RSI_EMA': RSIEMAStrategy(),
-        'Bollinger_Bands': BollingerBandsStrategy(),
-    }
-    
-    if strategy_name in strategies:
-        return strategies[strategy_name]
-    else:
+    if not _STRATEGIES:
+        _STRATEGIES.update({
+            'RSI': RSIStrategy(),
+            'EMA_Cross': EMAStrategy(),
+            'RSI_EMA': RSIEMAStrategy(),
+            'Bollinger_Bands': BollingerBandsStrategy(),
+        })
+        
+    strategy = _STRATEGIES.get(strategy_name)
+    if strategy is None:
         logger.warning(f"Strategy {strategy_name} not found. Using default RSI_EMA strategy.")
-        return strategies['RSI_EMA']
\ No newline at end of file
+        return _STRATEGIES['RSI_EMA']
+    return strategy
\ No newline at end of file